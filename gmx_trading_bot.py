@@ -8,15 +8,78 @@ Python High-Frequency Bot with GMX Integration on Arbitrum (Aggressive Mode).
 """
 
 import os
+import sys
+import atexit
+import queue
+import logging
+import logging.handlers
 import time
+import asyncio
+import sqlite3
 import requests
-import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import numpy as np
-import ta
-from datetime import datetime
-from flask import Flask, jsonify
-from threading import Thread
-from collections import deque  # for a fixed-size log buffer
+from dataclasses import dataclass, fields
+from typing import Optional
+from flask import Flask, Response
+from threading import Thread, Lock, Event
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+try:
+    import websockets
+except ImportError:
+    websockets = None  # type: ignore[assignment]
+
+# uvloop is a faster drop-in event loop for the kline stream thread.
+try:
+    import uvloop
+except ImportError:
+    uvloop = None  # type: ignore[assignment]
+
+# numba is optional: without it the @njit kernels below run as plain Python.
+# numba can't JIT functions from a mypyc-compiled build of this module (loaded
+# from an extension, not the .py), so those keep mypyc's native versions.
+try:
+    if not __file__.endswith(".py"):
+        raise ImportError("compiled module")
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):  # type: ignore[no-redef]
+        if args and callable(args[0]):
+            return args[0]
+        return lambda f: f
+
+# mypyc (when compiling this module) needs mixins marked as traits; a no-op otherwise.
+try:
+    from mypy_extensions import trait
+except ImportError:
+    def trait(cls):  # type: ignore[misc]
+        return cls
+
+# TA-Lib (C) computes the cold-start SMA/RSI window in one native pass each.
+try:
+    import talib
+except ImportError:
+    talib = None  # type: ignore[assignment]
+
+# orjson parses the numeric-heavy kline payloads several times faster than
+# the stdlib decoder; both accept bytes. json_dumps always returns bytes.
+try:
+    from orjson import loads as json_loads, dumps as json_dumps
+except ImportError:
+    import json
+    json_loads = json.loads  # type: ignore[assignment]
+
+    def json_dumps(obj):  # type: ignore[misc]
+        return json.dumps(obj).encode()
+
+# waitress is a threaded production WSGI server; Flask's dev server is the fallback.
+try:
+    from waitress import serve
+except ImportError:
+    serve = None  # type: ignore[assignment]
 
 # ------------------------------------------------------------------------------------
 # GMX / Web3 CONFIG
@@ -28,6 +91,9 @@ LIVE_TRADING = False  # Set True to actually send trades to GMX
 # to mainnet.
 GMX_VERSION = os.getenv("GMX_VERSION", "v1").lower()
 ARBITRUM_RPC = "https://arb1.arbitrum.io/rpc"
+# Optional persistent WebSocket JSON-RPC endpoint (e.g. wss://arb1.arbitrum.io/ws).
+# When set, all RPCs share one connection; otherwise ARBITRUM_RPC over HTTP is used.
+ARBITRUM_WSS = os.getenv("ARBITRUM_WSS")
 PRIVATE_KEY = os.getenv("PRIVATE_KEY") or "0xyourprivatekeyHERE"
 ACCOUNT_ADDRESS = None  # will be derived from private key
 
@@ -98,11 +164,74 @@ WITHDRAWAL_HANDLER_ADDR_V2 = os.getenv(
     "0xedB5cD878871F074371e816AC67CbE010c31f00b",
 )
 
+# minExecutionFee is re-read from the PositionRouter at most this often (seconds)
+MIN_EXEC_FEE_TTL = 60
+# EIP-1559 fee fields are re-derived from the latest block at most this often (seconds)
+BASE_FEE_TTL = 30
+
+# GMX prices/sizes are USD scaled by 1e30; USDT has 6 decimals.
+PRICE_PRECISION = 10**30
+USDT_DECIMALS = 10**6
+# Acceptable execution price for a new position: +/- this many basis points from the last price
+ACCEPTABLE_SLIPPAGE_BP = 100
+
+# PositionRouter.createIncreasePosition argument types. Calldata is encoded
+# once from these and only the per-trade head words are patched afterwards.
+INCREASE_POSITION_TYPES = ["address[]", "address", "uint256", "uint256", "uint256",
+                           "bool", "uint256", "uint256", "bytes32", "address"]
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+# keccak("approve(address,uint256)")[:4]
+ERC20_APPROVE_SELECTOR = bytes.fromhex("095ea7b3")
+
 # ABIs needed for live trading
 # Only a subset of each contract's ABI is included for brevity.
 # For production use, replace these with the full verified ABIs.
-POSITION_ROUTER_ABI = []
-ROUTER_ABI = []
+POSITION_ROUTER_ABI = [
+    {
+        "inputs": [
+            {"internalType": "address[]", "name": "_path", "type": "address[]"},
+            {"internalType": "address", "name": "_indexToken", "type": "address"},
+            {"internalType": "uint256", "name": "_amountIn", "type": "uint256"},
+            {"internalType": "uint256", "name": "_minOut", "type": "uint256"},
+            {"internalType": "uint256", "name": "_sizeDelta", "type": "uint256"},
+            {"internalType": "bool", "name": "_isLong", "type": "bool"},
+            {"internalType": "uint256", "name": "_acceptablePrice", "type": "uint256"},
+            {"internalType": "uint256", "name": "_executionFee", "type": "uint256"},
+            {"internalType": "bytes32", "name": "_referralCode", "type": "bytes32"},
+            {"internalType": "address", "name": "_callbackTarget", "type": "address"},
+        ],
+        "name": "createIncreasePosition",
+        "outputs": [{"internalType": "bytes32", "name": "", "type": "bytes32"}],
+        "stateMutability": "payable",
+        "type": "function",
+    },
+    {
+        "inputs": [],
+        "name": "minExecutionFee",
+        "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}],
+        "stateMutability": "view",
+        "type": "function",
+    },
+]
+ROUTER_ABI = [
+    {
+        "inputs": [{"internalType": "address", "name": "_plugin", "type": "address"}],
+        "name": "approvePlugin",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function",
+    },
+    {
+        "inputs": [
+            {"internalType": "address", "name": "", "type": "address"},
+            {"internalType": "address", "name": "", "type": "address"},
+        ],
+        "name": "approvedPlugins",
+        "outputs": [{"internalType": "bool", "name": "", "type": "bool"}],
+        "stateMutability": "view",
+        "type": "function",
+    },
+]
 EXCHANGE_ROUTER_ABI = [
     {
         "inputs": [
@@ -179,6 +308,16 @@ ERC20_ABI = [
         "outputs": [{"name": "", "type": "bool"}],
         "type": "function",
     },
+    {
+        "constant": True,
+        "inputs": [
+            {"name": "_owner", "type": "address"},
+            {"name": "_spender", "type": "address"},
+        ],
+        "name": "allowance",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "type": "function",
+    },
 ]
 
 # Set active addresses based on selected GMX version
@@ -198,6 +337,12 @@ else:
 # ------------------------------------------------------------------------------------
 BINANCE_API_BASE = "https://api.binance.com"
 BINANCE_SYMBOL = "ETHUSDT"
+BINANCE_WS_BASE = "wss://stream.binance.com:9443"
+# Stream klines over a WebSocket instead of polling REST every cycle.
+# Falls back to REST polling if `websockets` is missing or the stream drops.
+USE_WEBSOCKET = True
+# Reconnect the kline stream if no message arrives for this long (seconds)
+STREAM_STALE_TIMEOUT = 30
 
 SHORT_TIMEFRAME = "1m"
 MEDIUM_TIMEFRAME = "5m"
@@ -217,8 +362,22 @@ RISK_PER_TRADE_PCT = 1.0
 # Extra factor for paper trades => simulating high leverage
 PAPER_LEVERAGE_FACTOR = 10
 
+# Stop-loss / take-profit as multiples of the entry price (0.5% each way)
+SL_MULT_LONG = 0.995
+TP_MULT_LONG = 1.005
+SL_MULT_SHORT = 1.005
+TP_MULT_SHORT = 0.995
+
 LOOP_INTERVAL = 5
 
+# Closed candles are kept in this SQLite file so a restart only fetches the
+# missing tail. Set CANDLE_DB="" to disable.
+CANDLE_DB_PATH = os.getenv("CANDLE_DB", "candles.db")
+
+# Cross-check the incremental indicators against the `ta` package every update
+# (dev only: imports ta/pandas lazily and recomputes the whole window).
+DEBUG = os.getenv("DEBUG", "").lower() in ("1", "true", "yes")
+
 # ------------------------------------------------------------------------------------
 # FLASK + GLOBAL STATUS
 # ------------------------------------------------------------------------------------
@@ -233,201 +392,826 @@ status_data = {
     "last_action": "NONE"
 }
 
-status_logs = deque(maxlen=50)
+# Last STATUS_LOG_SIZE log lines in a fixed ring. log_message runs on several
+# threads, so the slot store and head advance happen together under _log_lock,
+# and readers copy the ring under it too.
+STATUS_LOG_SIZE = 50
+_log_buf = np.empty(STATUS_LOG_SIZE, dtype=object)
+_log_head = 0  # number of lines written so far
+_log_lock = Lock()
+
+def recent_logs():
+    """Logged lines currently in the ring, oldest first."""
+    with _log_lock:
+        head = _log_head
+        if head <= STATUS_LOG_SIZE:
+            return _log_buf[:head].tolist()
+        split = head % STATUS_LOG_SIZE
+        return _log_buf[split:].tolist() + _log_buf[:split].tolist()
+
+# /status body, serialized once per cycle by publish_status(). Rebinding a
+# bytes object is atomic, so the Flask thread never sees a half-built value.
+_status_bytes = b"{}"
+
+def publish_status():
+    global _status_bytes
+    data = dict(status_data)
+    data["logs"] = recent_logs()
+    _status_bytes = json_dumps(data)
 
 @app.route("/status")
 def status():
-    data = dict(status_data)
-    data["logs"] = list(status_logs)
-    return jsonify(data)
-
-def log_message(msg):
-    timestamp = datetime.utcnow().strftime("%H:%M:%S")
-    line = f"[{timestamp}] {msg}"
-    status_logs.append(line)
-    print(line)
+    return Response(_status_bytes, mimetype="application/json")
+
+# Last formatted log timestamp as [epoch second, "HH:MM:SS"]; reformatted once per second.
+_ts_cache = [0, ""]
+
+# Console output goes through a queue and is written by a listener thread, so
+# the trading loop never blocks on stdout. LOG_LEVEL filters before formatting.
+logger = logging.getLogger("gmx_bot")
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+logger.propagate = False
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler(sys.stdout))
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+def log_message(msg, *args, level=logging.INFO):
+    """Log a line; `args` are %-formatted into `msg` only here, at emit time."""
+    global _log_head
+    if not logger.isEnabledFor(level):
+        return
+    if args:
+        msg = msg % args
+    now = int(time.time())
+    if now != _ts_cache[0]:
+        _ts_cache[:] = [now, time.strftime("%H:%M:%S", time.gmtime(now))]
+    line = f"[{_ts_cache[1]}] {msg}"
+    with _log_lock:
+        _log_buf[_log_head % STATUS_LOG_SIZE] = line
+        _log_head += 1
+    logger.log(level, line)
 
 # ------------------------------------------------------------------------------------
 # HELPER FUNCTIONS
 # ------------------------------------------------------------------------------------
-def fetch_binance_candles(symbol, interval, limit=200):
-    url = f"{BINANCE_API_BASE}/api/v3/klines"
-    params = {"symbol": symbol, "interval": interval, "limit": limit}
+# One keep-alive session for all Binance calls so each cycle reuses the warm
+# TLS connection instead of doing a fresh handshake per request.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=4,
+                                      max_retries=Retry(total=2, backoff_factor=0.2)))
+
+# Medium and short timeframes are fetched side by side each cycle.
+EXECUTOR = ThreadPoolExecutor(max_workers=2)
+
+@dataclass
+class Candles:
+    """
+    Candle window stored column-wise (oldest first), plus indicator columns.
+    Only open time and close are kept: nothing downstream reads O/H/L/V.
+    """
+    ts: np.ndarray      # open time in ms, int64
+    close: np.ndarray
+    sma: np.ndarray
+    rsi: np.ndarray
+
+    def __len__(self):
+        return len(self.ts)
+
+    @classmethod
+    def from_klines(cls, klines):
+        """Build from raw Binance kline rows ([open_time, o, h, l, c, v, ...])."""
+        # Pull the two needed columns straight out of the row lists rather
+        # than boxing the whole 12-column payload into an object array.
+        n = len(klines)
+        return cls(
+            ts=np.fromiter((k[0] for k in klines), dtype=np.int64, count=n),
+            close=np.fromiter((float(k[4]) for k in klines), dtype=np.float64, count=n),
+            sma=np.full(n, np.nan),
+            rsi=np.full(n, np.nan)
+        )
+
+@lru_cache(maxsize=None)
+def _klines_url(symbol, interval, limit):
+    # Only startTime varies between polls, so the rest of the query is built once.
+    return f"{BINANCE_API_BASE}/api/v3/klines?symbol={symbol}&interval={interval}&limit={limit}"
+
+def fetch_binance_candles(symbol, interval, limit=200, start_time_ms=None):
+    url = _klines_url(symbol, interval, limit)
+    if start_time_ms is not None:
+        url += f"&startTime={start_time_ms}"
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = SESSION.get(url, timeout=10)
         response.raise_for_status()
-        data = response.json()
-
-        df_list = []
-        for kline in data:
-            df_list.append({
-                "timestamp": kline[0],
-                "open": float(kline[1]),
-                "high": float(kline[2]),
-                "low": float(kline[3]),
-                "close": float(kline[4]),
-                "volume": float(kline[5])
-            })
-        df = pd.DataFrame(df_list)
-        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms", utc=True)
-        df.sort_values("timestamp", inplace=True, ascending=True)
-        df.reset_index(drop=True, inplace=True)
-        log_message(f"Fetched {len(df)} candles for {symbol} {interval}.")
-        return df
+        data = json_loads(response.content)
+
+        # Binance already returns klines in ascending open-time order.
+        candles = Candles.from_klines(data)
+        log_message(f"Fetched {len(candles)} candles for {symbol} {interval}.")
+        return candles
     except Exception as e:
-        log_message(f"Error fetching candles for {symbol} {interval}: {e}")
-        return pd.DataFrame()
+        log_message(f"Error fetching candles for {symbol} {interval}: {e}", level=logging.WARNING)
+        return None
+
+_INTERVAL_UNIT_MS = {"m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 604_800_000}
+
+def interval_to_ms(interval):
+    """Binance interval string ("1m", "5m", "1h", ...) to milliseconds."""
+    return int(interval[:-1]) * _INTERVAL_UNIT_MS[interval[-1]]
+
+@njit(cache=True)
+def _rsi_wilder(close, n):
+    """
+    Wilder RSI in one pass over `close`.
+    Averages are seeded with the mean gain/loss of the first `n` changes, then
+    smoothed as avg = (avg*(n-1) + x) / n. Returns (rsi, avg_gain, avg_loss),
+    with the averages as of the last bar.
+    """
+    out = np.empty_like(close)
+    out[:] = np.nan
+    if len(close) <= n:
+        return out, np.nan, np.nan
+
+    avg_gain = 0.0
+    avg_loss = 0.0
+    for i in range(1, n + 1):
+        delta = close[i] - close[i - 1]
+        if delta > 0:
+            avg_gain += delta
+        else:
+            avg_loss -= delta
+    avg_gain /= n
+    avg_loss /= n
+    out[n] = 100.0 if avg_loss == 0 else 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+    for i in range(n + 1, len(close)):
+        delta = close[i] - close[i - 1]
+        avg_gain = (avg_gain * (n - 1) + max(delta, 0.0)) / n
+        avg_loss = (avg_loss * (n - 1) + max(-delta, 0.0)) / n
+        out[i] = 100.0 if avg_loss == 0 else 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    return out, avg_gain, avg_loss
+
+@njit(cache=True)
+def _wilder_step(prev_close, close, avg_gain, avg_loss, n):
+    """One Wilder smoothing step. Returns (rsi, avg_gain, avg_loss)."""
+    delta = close - prev_close
+    avg_gain = (avg_gain * (n - 1) + max(delta, 0.0)) / n
+    avg_loss = (avg_loss * (n - 1) + max(-delta, 0.0)) / n
+    rsi = 100.0 if avg_loss == 0 else 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    return rsi, avg_gain, avg_loss
+
+@njit(cache=True)
+def _advance_indicators(close, sma, rsi, start, w, n, prev_close, avg_gain, avg_loss):
+    """
+    Fill sma/rsi in place from row `start` to the end in a single fused pass.
+    Wilder state is committed for every row but the last (the open candle);
+    returns the committed (prev_close, avg_gain, avg_loss).
+    """
+    last = len(close) - 1
+    for i in range(start, len(close)):
+        sma[i] = sma[i - 1] + (close[i] - close[i - w]) / w
+        r, g, l = _wilder_step(prev_close, close[i], avg_gain, avg_loss, n)
+        rsi[i] = r
+        if i < last:
+            prev_close, avg_gain, avg_loss = close[i], g, l
+    return prev_close, avg_gain, avg_loss
+
+def warmup_kernels():
+    """Run each @njit kernel once at boot so the first live update doesn't pay for JIT compilation."""
+    close = np.linspace(1.0, 2.0, 32)
+    _, avg_gain, avg_loss = _rsi_wilder(close, RSI_PERIOD)
+    _wilder_step(close[-2], close[-1], avg_gain, avg_loss, RSI_PERIOD)
+    _advance_indicators(close, close.copy(), close.copy(), len(close) - 1, SMA_PERIOD, RSI_PERIOD,
+                        close[-2], avg_gain, avg_loss)
+
+def compute_indicators(candles, sma_period=20, rsi_period=14):
+    if candles is None or len(candles) == 0:
+        log_message("compute_indicators: no candles, skipping.")
+        return candles
+
+    log_message(f"Computing indicators (SMA={sma_period}, RSI={rsi_period}) on {len(candles)} rows.")
+    if talib is not None and len(candles) >= max(sma_period, rsi_period + 1):
+        # TA-Lib's RSI uses the same SMA-seeded Wilder smoothing as _rsi_wilder.
+        candles.sma = talib.SMA(candles.close, timeperiod=sma_period)
+        candles.rsi = talib.RSI(candles.close, timeperiod=rsi_period)
+        return candles
+
+    sma = np.full(len(candles), np.nan)
+    if len(candles) >= sma_period:
+        # Window sums as differences of one prefix sum: O(N) whatever the period.
+        csum = np.cumsum(candles.close)
+        sma[sma_period - 1:] = (csum[sma_period - 1:] - np.concatenate(([0.0], csum[:-sma_period]))) / sma_period
+    candles.sma = sma
+    candles.rsi = _rsi_wilder(candles.close, rsi_period)[0]
+    return candles
+
+def debug_check_indicators(candles, sma_period, rsi_period):
+    """Log if the latest SMA/RSI disagree with the `ta` reference implementation."""
+    import pandas as pd
+    import ta
+    close = pd.Series(candles.close)
+    ref_sma = ta.trend.SMAIndicator(close, window=sma_period).sma_indicator().iloc[-1]
+    ref_rsi = ta.momentum.RSIIndicator(close, window=rsi_period).rsi().iloc[-1]
+    # ta seeds Wilder smoothing with the first change rather than an SMA, so
+    # RSI only agrees once the seed has decayed (~1e-5 over a 200-row window).
+    if abs(candles.sma[-1] - ref_sma) > 1e-6 or abs(candles.rsi[-1] - ref_rsi) > 1e-3:
+        log_message("[!] Indicator mismatch: SMA=%.6f (ta %.6f), RSI=%.6f (ta %.6f)",
+                    candles.sma[-1], ref_sma, candles.rsi[-1], ref_rsi,
+                    level=logging.WARNING)
 
-def compute_indicators(df, sma_period=20, rsi_period=14):
-    if df.empty:
-        log_message("compute_indicators: DataFrame is empty, skipping.")
-        return df
+# ------------------------------------------------------------------------------------
+# CANDLE CACHE
+# ------------------------------------------------------------------------------------
+class RollingRSI:
+    """
+    Wilder RSI (RMA smoothing, as TradingView / pandas-ta) advanced one close
+    at a time: two multiply-adds per step instead of a pass over the window.
+    """
+    def __init__(self, n):
+        self.n = n
+        self.avg_gain = np.nan
+        self.avg_loss = np.nan
+        self.prev_close = np.nan
+
+    def seed(self, closes):
+        """Initialise from a run of closed candles (oldest first)."""
+        _, self.avg_gain, self.avg_loss = _rsi_wilder(closes, self.n)
+        self.prev_close = closes[-1] if len(closes) else np.nan
+
+    def update(self, close):
+        """Commit `close` as the next closed value and return the RSI."""
+        rsi, self.avg_gain, self.avg_loss = self._step(close)
+        self.prev_close = close
+        return rsi
+
+    def peek(self, close):
+        """RSI if `close` were the next value, without committing it."""
+        return self._step(close)[0]
+
+    def _step(self, close):
+        return _wilder_step(self.prev_close, close, self.avg_gain, self.avg_loss, self.n)
+
+class CandleStore:
+    """
+    SQLite store of closed candles keyed by (symbol, interval, open time).
+    Shared by every CandleCache; writes are serialized by a lock because the
+    caches are updated from both the REST workers and the stream thread.
+    """
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS candles ("
+            "symbol TEXT, interval TEXT, ts INTEGER, close REAL, "
+            "PRIMARY KEY (symbol, interval, ts))")
+        self.lock = Lock()
+
+    def load(self, symbol, interval, limit):
+        """Newest `limit` stored candles, oldest first, as (ts, close) arrays."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT ts, close FROM candles WHERE symbol = ? AND interval = ? "
+                "ORDER BY ts DESC LIMIT ?", (symbol, interval, limit)).fetchall()
+        rows.reverse()
+        n = len(rows)
+        return (np.fromiter((r[0] for r in rows), dtype=np.int64, count=n),
+                np.fromiter((r[1] for r in rows), dtype=np.float64, count=n))
+
+    def save(self, symbol, interval, ts, close, keep_from_ms):
+        """Insert closed candles and drop the ones older than `keep_from_ms`."""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO candles VALUES (?, ?, ?, ?)",
+                zip((symbol,) * len(ts), (interval,) * len(ts), ts.tolist(), close.tolist()))
+            self.conn.execute(
+                "DELETE FROM candles WHERE symbol = ? AND interval = ? AND ts < ?",
+                (symbol, interval, keep_from_ms))
+
+class CandleCache:
+    """
+    Rolling candle window for one symbol/timeframe.
+
+    The first refresh fetches `limit` candles and computes indicators over the
+    whole window. After that only candles from the last cached open time onward
+    are requested, and SMA/RSI are advanced one row at a time:
+      SMA[t] = SMA[t-1] + (C[t] - C[t-w]) / w
+      avg    = (avg * (n-1) + new) / n          (Wilder smoothing)
+    The last Binance kline is the still-open candle, so Wilder state is only
+    committed up to the last closed row and the open row is recomputed each time.
+
+    `candles` is replaced, never mutated in place, so readers can hold on to
+    the object they got without locking.
+    """
+    def __init__(self, symbol, interval, limit=200, sma_period=20, rsi_period=14, store=None):
+        self.symbol = symbol
+        self.interval = interval
+        self.interval_ms = interval_to_ms(interval)
+        self.limit = limit
+        self.sma_period = sma_period
+        self.rsi_period = rsi_period
+        self.candles = None
+        self.lock = Lock()
+        self.store = store
+        # Wilder state as of the last closed candle (row -2)
+        self.rsi_state = RollingRSI(rsi_period)
+
+    def refresh(self):
+        """Update the cached window. Returns None if the fetch failed."""
+        with self.lock:
+            return self._refresh_locked()
+
+    def _refresh_locked(self):
+        if self.candles is None:
+            return self._full_refresh()
+
+        new = fetch_binance_candles(self.symbol, self.interval, limit=self.limit,
+                                    start_time_ms=int(self.candles.ts[-1]))
+        if new is None or len(new) == 0:
+            return None
+        if len(new) >= self.limit:
+            # Too far behind to stitch onto the cache (and `new` may not even
+            # reach the present); start over from the latest window.
+            new = fetch_binance_candles(self.symbol, self.interval, limit=self.limit)
+            if new is None or len(new) == 0:
+                return None
+            return self._full_refresh(new)
+        return self._merge(new)
+
+    def apply_kline(self, k):
+        """
+        Merge one pushed kline (the `k` payload of a Binance kline event).
+        Returns the updated window, or None if a needed backfill failed.
+        """
+        row = Candles(ts=np.array([k["t"]], dtype=np.int64),
+                      close=np.array([float(k["c"])]),
+                      sma=np.full(1, np.nan),
+                      rsi=np.full(1, np.nan))
+        with self.lock:
+            if self.candles is None:
+                # No window yet (e.g. the REST fetch at connect failed): build one.
+                if self._full_refresh() is None:
+                    return None
+            if row.ts[0] < self.candles.ts[-1]:
+                return self.candles
+            if row.ts[0] > self.candles.ts[-1] + self.interval_ms:
+                # Missed at least one candle; backfill over REST first so the
+                # recurrences never step across a hole.
+                log_message(f"Gap in {self.symbol} {self.interval} stream, backfilling over REST.")
+                if self._refresh_locked() is None:
+                    return None
+            return self._merge(row)
+
+    def needs_io(self, open_ts):
+        """True if merging a kline opened at `open_ts` would hit REST or the candle store."""
+        candles = self.candles
+        if candles is None or open_ts > candles.ts[-1] + self.interval_ms:
+            return True
+        # A new candle closes the previous one, which is written to the store.
+        return self.store is not None and open_ts > candles.ts[-1]
+
+    def _merge(self, new):
+        old = self.candles
+        if len(new) == 1 and new.ts[0] == old.ts[-1] and new.close[0] == old.close[-1]:
+            # Same open candle at the same price: indicators are still valid.
+            return old
+        # Old rows from the first new open time on are superseded.
+        keep = int(np.searchsorted(old.ts, new.ts[0]))
+        merged = Candles(**{
+            f.name: np.concatenate((getattr(old, f.name)[:keep], getattr(new, f.name)))[-self.limit:]
+            for f in fields(Candles)
+        })
+        # Wilder state is committed up to the row before the previously open
+        # candle, so recompute from that candle onward.
+        first_row = int(np.searchsorted(merged.ts, old.ts[-1]))
+        self._update_indicators(merged, first_row)
+        if first_row < len(merged) - 1:
+            # The previously open candle (and any backfilled ones) closed.
+            self._save_closed(merged, first_row)
+        if DEBUG:
+            debug_check_indicators(merged, self.sma_period, self.rsi_period)
+        self.candles = merged
+        return merged
+
+    def _full_refresh(self, candles=None):
+        if candles is None:
+            candles = self._load_and_fetch()
+            if candles is None or len(candles) == 0:
+                return None
+        candles = compute_indicators(candles, sma_period=self.sma_period, rsi_period=self.rsi_period)
+
+        # Seed Wilder state from the closed candles only (the last row is open).
+        self.rsi_state.seed(candles.close[:-1])
+        self._save_closed(candles, 0)
+        self.candles = candles
+        return candles
+
+    def _load_and_fetch(self):
+        """Stored closed candles plus the missing tail from REST, or a full fetch."""
+        if self.store is not None:
+            ts, close = self.store.load(self.symbol, self.interval, self.limit)
+            if len(ts):
+                tail = fetch_binance_candles(self.symbol, self.interval, limit=self.limit,
+                                             start_time_ms=int(ts[-1]) + self.interval_ms)
+                if tail is None:
+                    return None
+                if 0 < len(tail) < self.limit:
+                    n = min(len(ts) + len(tail), self.limit)
+                    return Candles(ts=np.concatenate((ts, tail.ts))[-n:],
+                                   close=np.concatenate((close, tail.close))[-n:],
+                                   sma=np.full(n, np.nan),
+                                   rsi=np.full(n, np.nan))
+                # Stored candles are too old (or don't line up); fall through to a full fetch.
+        return fetch_binance_candles(self.symbol, self.interval, limit=self.limit)
+
+    def _save_closed(self, candles, first_row):
+        """Persist rows first_row..-2 (closed); the last row is still open."""
+        if self.store is None or first_row >= len(candles) - 1:
+            return
+        keep_from_ms = int(candles.ts[-1]) - self.limit * self.interval_ms
+        try:
+            self.store.save(self.symbol, self.interval, candles.ts[first_row:-1],
+                            candles.close[first_row:-1], keep_from_ms)
+        except sqlite3.Error as e:
+            log_message(f"[!] Could not store {self.symbol} {self.interval} candles: {e}",
+                        level=logging.WARNING)
+
+    def _update_indicators(self, candles, first_row):
+        st = self.rsi_state
+        st.prev_close, st.avg_gain, st.avg_loss = _advance_indicators(
+            candles.close, candles.sma, candles.rsi, first_row, self.sma_period, st.n,
+            st.prev_close, st.avg_gain, st.avg_loss)
 
-    log_message(f"Computing indicators (SMA={sma_period}, RSI={rsi_period}) on {len(df)} rows.")
-    df = df.rename(columns={"open": "Open","high": "High","low": "Low","close": "Close","volume": "Volume"})
-    df["SMA"] = ta.trend.SMAIndicator(df["Close"], window=sma_period).sma_indicator()
-    df["RSI"] = ta.momentum.RSIIndicator(df["Close"], window=rsi_period).rsi()
-    return df
+# ------------------------------------------------------------------------------------
+# KLINE STREAM
+# ------------------------------------------------------------------------------------
+# Set by KlineStream when any subscribed kline closes; wakes the main loop.
+NEW_CANDLE = Event()
+
+
+class KlineStream:
+    """
+    Binance combined kline stream feeding a set of CandleCaches.
+
+    Caches for any mix of symbols and intervals share one connection
+    (`/stream?streams=ethusdt@kline_5m/btcusdt@kline_5m/...`); each message is
+    routed to its cache by the `stream` name it arrives with.
+
+    Runs its own asyncio loop in a daemon thread. Every pushed kline (open or
+    closed) is merged into the matching cache, so readers always see the latest
+    candle without a REST round trip. On (re)connect each cache is refreshed
+    over REST to backfill whatever was missed while disconnected.
+    """
+    def __init__(self, caches):
+        self.caches = {f"{c.symbol.lower()}@kline_{c.interval}": c for c in caches}
+        self.url = f"{BINANCE_WS_BASE}/stream?streams=" + "/".join(self.caches)
+        self.connected = False
+
+    def start(self):
+        # uvloop.run only exists from uvloop 0.18; older releases use asyncio.run.
+        run = getattr(uvloop, "run", None) or asyncio.run
+        Thread(target=lambda: run(self._run()), daemon=True).start()
+
+    def _update_connected(self):
+        # Only serve from the stream once every cache has a window; until then
+        # main_loop keeps polling REST.
+        self.connected = all(c.candles is not None for c in self.caches.values())
+
+    async def _run(self):
+        while True:
+            try:
+                async with websockets.connect(self.url, ping_interval=20) as ws:
+                    log_message(f"Kline stream connected: {self.url}")
+                    # REST and SQLite work runs in worker threads so the socket keeps being read.
+                    await asyncio.gather(*(asyncio.to_thread(c.refresh) for c in self.caches.values()))
+                    self._update_connected()
+                    while True:
+                        # Binance pushes every kline stream at least every ~2s; a
+                        # silent socket means the feed is stale, so reconnect.
+                        raw = await asyncio.wait_for(ws.recv(), timeout=STREAM_STALE_TIMEOUT)
+                        msg = json_loads(raw)
+                        cache = self.caches.get(msg.get("stream"))
+                        if cache is not None:
+                            k = msg["data"]["k"]
+                            if cache.needs_io(k["t"]):
+                                await asyncio.to_thread(cache.apply_kline, k)
+                            else:
+                                cache.apply_kline(k)
+                            if not self.connected:
+                                self._update_connected()
+                            if k.get("x"):
+                                NEW_CANDLE.set()
+            except asyncio.TimeoutError:
+                log_message(f"[!] Kline stream silent for {STREAM_STALE_TIMEOUT}s. Reconnecting in {LOOP_INTERVAL}s.",
+                            level=logging.WARNING)
+            except Exception as e:
+                log_message(f"[!] Kline stream error: {e}. Reconnecting in {LOOP_INTERVAL}s.",
+                            level=logging.WARNING)
+            self.connected = False
+            await asyncio.sleep(LOOP_INTERVAL)
 
 # ------------------------------------------------------------------------------------
 # WEB3 SETUP (IF LIVE_TRADING)
 # ------------------------------------------------------------------------------------
-try:
-    from web3 import Web3, exceptions
-    web3 = Web3(Web3.HTTPProvider(ARBITRUM_RPC))
-    if LIVE_TRADING:
+# web3.py (with eth_account / eth_abi) is only imported for live trading, so the
+# default paper mode never pays its import time or memory. Written against the
+# web3.py v7 / eth-account >= 0.13 API (raw_transaction, encode_abi).
+web3 = None
+acct = None
+USDT_CS = WETH_CS = ROUTER_CS = POSITION_ROUTER_CS = None
+INCREASE_POSITION_SELECTOR = APPROVE_PLUGIN_SELECTOR = None
+abi_encode = None
+
+if LIVE_TRADING:
+    try:
+        from web3 import Web3, exceptions
+        from eth_abi import encode as abi_encode  # type: ignore[no-redef]
+        INCREASE_POSITION_SELECTOR = bytes(Web3.keccak(
+            text="createIncreasePosition(" + ",".join(INCREASE_POSITION_TYPES) + ")")[:4])
+        APPROVE_PLUGIN_SELECTOR = bytes(Web3.keccak(text="approvePlugin(address)")[:4])
+        # Checksum the constant addresses once instead of re-hashing per call/trade.
+        USDT_CS = Web3.to_checksum_address(USDT_ADDR)
+        WETH_CS = Web3.to_checksum_address(WETH_ADDR)
+        ROUTER_CS = Web3.to_checksum_address(ROUTER_ADDR)
+        POSITION_ROUTER_CS = Web3.to_checksum_address(POSITION_ROUTER_ADDR) if POSITION_ROUTER_ADDR else None
+        if ARBITRUM_WSS:
+            web3 = Web3(Web3.LegacyWebSocketProvider(ARBITRUM_WSS))
+        else:
+            web3 = Web3(Web3.HTTPProvider(ARBITRUM_RPC))
         if not web3.is_connected():
-            log_message("ERROR: Web3 not connected to Arbitrum. Check your RPC URL.")
+            log_message("ERROR: Web3 not connected to Arbitrum. Check your RPC URL.", level=logging.ERROR)
         else:
             log_message("Connected to Arbitrum via Web3.")
         acct = web3.eth.account.from_key(PRIVATE_KEY)
         ACCOUNT_ADDRESS = acct.address
         log_message(f"Trading with account: {ACCOUNT_ADDRESS}")
-    else:
+    except ImportError:
         web3 = None
         acct = None
-except ImportError:
-    web3 = None
-    acct = None
-    log_message("web3.py not installed or import error. LIVE_TRADING will fail if set True.")
+        log_message("web3.py not installed or import error. LIVE_TRADING will fail.", level=logging.ERROR)
 
 # ------------------------------------------------------------------------------------
 # GMX CONNECTOR
 # ------------------------------------------------------------------------------------
-class GMXConnector:
+def eip1559_fees(web3):
+    """Type-2 fee fields: 2x the latest base fee as headroom, no tip (Arbitrum ignores it)."""
+    base_fee = web3.eth.get_block("latest")["baseFeePerGas"]
+    return {'type': 2, 'maxFeePerGas': 2 * base_fee, 'maxPriorityFeePerGas': 0}
+
+def erc20_approve_data(spender, amount):
+    """Calldata for ERC20 approve(spender, amount), encoded directly without a contract ABI."""
+    return ERC20_APPROVE_SELECTOR + abi_encode(["address", "uint256"], [spender, amount])
+
+def erc20_allowance_covers(token, owner, spender, amount):
+    """
+    True if `spender` may already move `amount` of `token` for `owner`, so the
+    approve tx can be skipped. A failed read returns False: approving again is
+    harmless, skipping a needed approval is not.
+    """
+    try:
+        return token.functions.allowance(owner, spender).call() >= amount
+    except Exception as e:
+        log_message(f"[!] Could not read allowance ({e}), approving anyway.", level=logging.WARNING)
+        return False
+
+def prime_steps(label, steps):
+    """Run each (name, fn) warm-up step on its own, so one failing read doesn't skip the rest."""
+    for name, step in steps:
+        try:
+            step()
+        except Exception as e:
+            log_message(f"[!] {label} prime error ({name}): {e}", level=logging.WARNING)
+
+@trait
+class LocalNonceMixin:
+    """
+    Account nonce read from the chain once ("pending") and then incremented
+    locally, saving an RPC round trip per transaction. Call _reset_nonce()
+    after any failed send so the next transaction resyncs.
+    """
+    _local_nonce = None
+
+    def _sync_nonce(self):
+        if self._local_nonce is None:
+            self._local_nonce = self.web3.eth.get_transaction_count(self.account.address, "pending")
+
+    def _next_nonce(self):
+        self._sync_nonce()
+        nonce = self._local_nonce
+        self._local_nonce += 1
+        return nonce
+
+    def _reset_nonce(self):
+        # e.g. "nonce too low" or a tx that never got sent: re-read from chain next time
+        self._local_nonce = None
+
+@trait
+class CachedFeeMixin:
+    """
+    eip1559_fees() re-read at most every BASE_FEE_TTL seconds, so sending a
+    trade doesn't also cost an eth_getBlock round trip. The 2x base-fee
+    headroom covers the base fee drifting between refreshes.
+    """
+    _cached_fees = None
+    _cached_fees_ts = None
+
+    def _fee_fields(self):
+        now = time.monotonic()
+        if self._cached_fees_ts is None or now - self._cached_fees_ts > BASE_FEE_TTL:
+            self._cached_fees = eip1559_fees(self.web3)
+            self._cached_fees_ts = now
+        return self._cached_fees
+
+class GMXConnector(LocalNonceMixin, CachedFeeMixin):
     def __init__(self, web3, account, do_live=False):
         self.web3 = web3
         self.account = account
         self.do_live = do_live
+        # minExecutionFee rarely changes, so it is cached like the nonce and
+        # fee fields the mixins keep, saving an RPC per trade.
+        self._cached_min_fee = None
+        self._cached_min_fee_ts = 0.0
+        self._increase_template = None
 
         if self.web3 and self.do_live:
             self.position_router = self.web3.eth.contract(
-                address=Web3.to_checksum_address(POSITION_ROUTER_ADDR),
+                address=POSITION_ROUTER_CS,
                 abi=POSITION_ROUTER_ABI
             )
             self.router = self.web3.eth.contract(
-                address=Web3.to_checksum_address(ROUTER_ADDR),
+                address=ROUTER_CS,
                 abi=ROUTER_ABI
             )
             self.usdt = self.web3.eth.contract(
-                address=Web3.to_checksum_address(USDT_ADDR),
-                abi=USDT_ABI
+                address=USDT_CS,
+                abi=ERC20_ABI
             )
+            # Fields of the createIncreasePosition tx that never change between trades
+            self._increase_base_tx = {
+                'to': POSITION_ROUTER_CS,
+                'from': self.account.address,
+                'gas': 500000,
+                'chainId': 42161
+            }
         else:
             self.position_router = None
             self.router = None
             self.usdt = None
 
+    def _get_min_exec_fee(self):
+        now = time.monotonic()
+        if self._cached_min_fee is None or now - self._cached_min_fee_ts > MIN_EXEC_FEE_TTL:
+            self._cached_min_fee = self.position_router.functions.minExecutionFee().call()
+            self._cached_min_fee_ts = now
+        return self._cached_min_fee
+
+    def prime(self):
+        """Fetch the nonce, execution fee and fee fields and build the calldata template ahead of the first trade."""
+        prime_steps("GMX", [
+            ("minExecutionFee", self._get_min_exec_fee),
+            ("fee fields", self._fee_fields),
+            ("nonce", self._sync_nonce),
+            ("calldata template", lambda: self._increase_position_data(0, 0, False, 0, 0)),
+        ])
+
     def approve_plugin(self):
         if not self.do_live:
             log_message("Simulate: approvePlugin -> no real tx sent.")
             return
         try:
-            nonce = self.web3.eth.get_transaction_count(self.account.address)
-            tx = self.router.functions.approvePlugin(POSITION_ROUTER_ADDR).buildTransaction({
+            approved = self.router.functions.approvedPlugins(self.account.address, POSITION_ROUTER_CS).call()
+        except Exception as e:
+            log_message(f"[!] Could not read plugin approval ({e}), approving anyway.", level=logging.WARNING)
+            approved = False
+        if approved:
+            log_message("PositionRouter plugin already approved, skipping.")
+            return
+        try:
+            nonce = self._next_nonce()
+            tx = {
+                'to': ROUTER_CS,
                 'from': self.account.address,
+                'data': APPROVE_PLUGIN_SELECTOR + abi_encode(["address"], [POSITION_ROUTER_CS]),
                 'nonce': nonce,
                 'gas': 100000,
-                'chainId': 42161
-            })
+                'chainId': 42161,
+                **self._fee_fields()
+            }
             signed = self.account.sign_transaction(tx)
-            tx_hash = self.web3.eth.send_raw_transaction(signed.rawTransaction)
+            tx_hash = self.web3.eth.send_raw_transaction(signed.raw_transaction)
             self.web3.eth.wait_for_transaction_receipt(tx_hash)
             log_message(f"Plugin approved! tx={tx_hash.hex()}")
         except exceptions.ContractLogicError as e:
-            log_message(f"[!] Plugin approval error: {e}")
+            self._reset_nonce()
+            log_message(f"[!] Plugin approval error: {e}", level=logging.WARNING)
         except Exception as e:
-            log_message(f"[!] Plugin approval unknown error: {e}")
+            self._reset_nonce()
+            log_message(f"[!] Plugin approval unknown error: {e}", level=logging.WARNING)
 
     def approve_usdt(self, amount):
         if not self.do_live:
             log_message(f"Simulate: USDT.approve(router, {amount}) -> no real tx sent.")
             return
+        if erc20_allowance_covers(self.usdt, self.account.address, ROUTER_CS, amount):
+            log_message("USDT allowance for Router already sufficient, skipping.")
+            return
         try:
-            nonce = self.web3.eth.get_transaction_count(self.account.address)
-            tx = self.usdt.functions.approve(ROUTER_ADDR, amount).buildTransaction({
+            nonce = self._next_nonce()
+            tx = {
+                'to': USDT_CS,
                 'from': self.account.address,
+                'data': erc20_approve_data(ROUTER_CS, amount),
                 'nonce': nonce,
                 'gas': 100000,
-                'chainId': 42161
-            })
+                'chainId': 42161,
+                **self._fee_fields()
+            }
             signed = self.account.sign_transaction(tx)
-            tx_hash = self.web3.eth.send_raw_transaction(signed.rawTransaction)
+            tx_hash = self.web3.eth.send_raw_transaction(signed.raw_transaction)
             self.web3.eth.wait_for_transaction_receipt(tx_hash)
             log_message(f"USDT approved for Router! tx={tx_hash.hex()}")
         except Exception as e:
-            log_message(f"[!] USDT approval error: {e}")
+            self._reset_nonce()
+            log_message(f"[!] USDT approval error: {e}", level=logging.WARNING)
 
-    def open_gmx_position(self, side, collateral_usdt, leverage_usd):
+    # Head word index of each per-trade argument in createIncreasePosition calldata
+    _AMOUNT_IN_WORD = 2
+    _SIZE_DELTA_WORD = 4
+    _IS_LONG_WORD = 5
+    _ACCEPTABLE_PRICE_WORD = 6
+    _EXEC_FEE_WORD = 7
+
+    def _increase_position_data(self, amount_in, size_delta, is_long, acceptable_price, min_exec_fee):
+        """
+        createIncreasePosition calldata. The constant arguments (path, index token,
+        referral code, callback) are ABI-encoded once; each trade copies that
+        template and overwrites the five variable 32-byte head words.
+        """
+        if self._increase_template is None:
+            args = [[USDT_CS], WETH_CS, 0, 0, 0, False, 0, 0, b'\x00' * 32, ZERO_ADDRESS]
+            data = INCREASE_POSITION_SELECTOR + abi_encode(INCREASE_POSITION_TYPES, args)
+            if any(e.get("name") == "createIncreasePosition" for e in POSITION_ROUTER_ABI):
+                expected = self.position_router.encode_abi("createIncreasePosition", args=args)
+                if Web3.to_bytes(hexstr=expected) != data:
+                    raise ValueError("createIncreasePosition calldata template does not match the ABI")
+            self._increase_template = data
+
+        data = bytearray(self._increase_template)
+        for word, value in ((self._AMOUNT_IN_WORD, amount_in),
+                            (self._SIZE_DELTA_WORD, size_delta),
+                            (self._IS_LONG_WORD, int(is_long)),
+                            (self._ACCEPTABLE_PRICE_WORD, acceptable_price),
+                            (self._EXEC_FEE_WORD, min_exec_fee)):
+            offset = 4 + 32 * word
+            data[offset:offset + 32] = value.to_bytes(32, "big")
+        return bytes(data)
+
+    def open_gmx_position(self, side, collateral_usdt, leverage_usd, current_price):
         """
         side: "long" or "short"
         collateral_usdt: how many USDT (int)
         leverage_usd: total notional e.g. 5x => if we put 200 USDT, size=1000
+        current_price: last observed ETH price, used for the acceptable price
         """
         if not self.do_live:
             log_message(f"Simulate GMX open {side}: Collateral={collateral_usdt} USDT, Notional={leverage_usd} USD.")
             return
         try:
-            min_exec_fee = self.position_router.functions.minExecutionFee().call()
+            min_exec_fee = self._get_min_exec_fee()
         except Exception as e:
-            log_message(f"[!] Could not fetch minExecutionFee: {e}")
+            log_message(f"[!] Could not fetch minExecutionFee: {e}", level=logging.WARNING)
             return
 
         is_long = (side == "long")
-        # Example: if price ~2000, we accept +1% or -1% slip
-        acceptable_price = int((1.01 if is_long else 0.99) * 2000 * 10**30)
+        # Integer math throughout: 1e30-scaled values don't fit a float64 mantissa.
+        # Accept up to ACCEPTABLE_SLIPPAGE_BP worse than the last price.
+        price_e30 = round(current_price * 100) * PRICE_PRECISION // 100
+        slip_bp = 10_000 + ACCEPTABLE_SLIPPAGE_BP if is_long else 10_000 - ACCEPTABLE_SLIPPAGE_BP
+        acceptable_price = price_e30 * slip_bp // 10_000
 
-        size_delta = int(leverage_usd * 10**30)
+        size_delta = round(leverage_usd * 100) * PRICE_PRECISION // 100
         amount_in = collateral_usdt  # e.g. 200 USDT => 200e6
-        path = [Web3.to_checksum_address(USDT_ADDR)]
-        min_out = 0
-        referral_code = b'\x00'*32
-        callback_target = "0x0000000000000000000000000000000000000000"
-
-        nonce = self.web3.eth.get_transaction_count(self.account.address)
-        tx = self.position_router.functions.createIncreasePosition(
-            path,
-            Web3.to_checksum_address(WETH_ADDR),
-            amount_in,
-            min_out,
-            size_delta,
-            is_long,
-            acceptable_price,
-            min_exec_fee,
-            referral_code,
-            callback_target
-        ).buildTransaction({
-            'from': self.account.address,
-            'value': min_exec_fee,
-            'nonce': nonce,
-            'gas': 500000,
-            'chainId': 42161
-        })
-        signed = self.account.sign_transaction(tx)
-        tx_hash = self.web3.eth.send_raw_transaction(signed.rawTransaction)
+
+        try:
+            data = self._increase_position_data(amount_in, size_delta, is_long,
+                                                acceptable_price, min_exec_fee)
+            nonce = self._next_nonce()
+            tx = {
+                **self._increase_base_tx,
+                'data': data,
+                'value': min_exec_fee,
+                'nonce': nonce,
+                **self._fee_fields()
+            }
+            signed = self.account.sign_transaction(tx)
+            tx_hash = self.web3.eth.send_raw_transaction(signed.raw_transaction)
+        except Exception as e:
+            self._reset_nonce()
+            log_message(f"[!] GMX IncreasePosition error: {e}", level=logging.WARNING)
+            return
         log_message(f"GMX IncreasePosition sent, tx={tx_hash.hex()} (Side={side}, Collat={amount_in}, Size={leverage_usd})")
 
-class GMXV2Connector:
+class GMXV2Connector(LocalNonceMixin, CachedFeeMixin):
     """Minimal connector skeleton for GMX V2."""
     def __init__(self, web3, account, do_live=False):
         self.web3 = web3
@@ -436,174 +1220,243 @@ class GMXV2Connector:
 
         if self.web3 and self.do_live:
             self.exchange_router = self.web3.eth.contract(
-                address=Web3.to_checksum_address(ROUTER_ADDR),
+                address=ROUTER_CS,
                 abi=EXCHANGE_ROUTER_ABI
             )
             self.collateral_token = self.web3.eth.contract(
-                address=Web3.to_checksum_address(USDT_ADDR),
+                address=USDT_CS,
                 abi=ERC20_ABI
             )
         else:
             self.exchange_router = None
             self.collateral_token = None
 
+    def prime(self):
+        """Fetch the nonce and fee fields ahead of the first order."""
+        prime_steps("GMXv2", [
+            ("fee fields", self._fee_fields),
+            ("nonce", self._sync_nonce),
+        ])
+
     def approve_collateral(self, amount):
         if not self.do_live:
             log_message(f"Simulate: approve collateral ({amount})")
             return
+        if erc20_allowance_covers(self.collateral_token, self.account.address, ROUTER_CS, amount):
+            log_message("Collateral allowance for GMX V2 router already sufficient, skipping.")
+            return
         try:
-            nonce = self.web3.eth.get_transaction_count(self.account.address)
-            tx = self.collateral_token.functions.approve(ROUTER_ADDR, amount).buildTransaction({
+            nonce = self._next_nonce()
+            tx = {
+                'to': USDT_CS,
                 'from': self.account.address,
+                'data': erc20_approve_data(ROUTER_CS, amount),
                 'nonce': nonce,
                 'gas': 100000,
-                'chainId': 42161
-            })
+                'chainId': 42161,
+                **self._fee_fields()
+            }
             signed = self.account.sign_transaction(tx)
-            tx_hash = self.web3.eth.send_raw_transaction(signed.rawTransaction)
+            tx_hash = self.web3.eth.send_raw_transaction(signed.raw_transaction)
             self.web3.eth.wait_for_transaction_receipt(tx_hash)
             log_message(f"Collateral approved for GMX V2 router! tx={tx_hash.hex()}")
         except Exception as e:
-            log_message(f"[!] Collateral approval error: {e}")
+            self._reset_nonce()
+            log_message(f"[!] Collateral approval error: {e}", level=logging.WARNING)
 
-    def open_gmx_position(self, side, collateral_usd, leverage_usd):
+    def open_gmx_position(self, side, collateral_usd, leverage_usd, current_price):
         """Placeholder implementation for sending a GMX V2 order."""
         if not self.do_live:
             log_message(f"Simulate GMXv2 open {side}: Collat={collateral_usd} USD, Size={leverage_usd} USD")
             return
         try:
-            nonce = self.web3.eth.get_transaction_count(self.account.address)
+            nonce = self._next_nonce()
             tx = {
-                'to': ROUTER_ADDR,
+                'to': ROUTER_CS,
                 'from': self.account.address,
                 'value': 0,
                 'nonce': nonce,
                 'gas': 500000,
-                'chainId': 42161
+                'chainId': 42161,
+                **self._fee_fields()
             }
             signed = self.account.sign_transaction(tx)
-            tx_hash = self.web3.eth.send_raw_transaction(signed.rawTransaction)
+            tx_hash = self.web3.eth.send_raw_transaction(signed.raw_transaction)
             log_message(f"GMXv2 position tx sent: {tx_hash.hex()} (side={side})")
         except Exception as e:
-            log_message(f"[!] GMXv2 trade error: {e}")
+            self._reset_nonce()
+            log_message(f"[!] GMXv2 trade error: {e}", level=logging.WARNING)
 
 # ------------------------------------------------------------------------------------
 # PAPER TRADING BOT
 # ------------------------------------------------------------------------------------
+# Paper positions live in one structured array (one row per slot) so exits for
+# every open position are checked with a single masked comparison.
+# Money is fixed-point: prices and balance in integer cents, sizes in 1e-4
+# units, so sizing and P&L are exact integer arithmetic.
+MAX_POSITIONS = 1
+LONG, SHORT = 1, -1
+PRICE_SCALE = 100
+SIZE_SCALE = 10_000
+RISK_SCALE = 1_000_000  # risk per trade as a fraction of balance, in parts per million
+POSITION_DTYPE = np.dtype([
+    ("side", "i1"),
+    ("entry", "i8"),    # cents
+    ("stop", "i8"),     # cents
+    ("tp", "i8"),       # cents
+    ("size", "i8"),     # 1e-4 units
+    ("live", "?"),
+])
+
+def _exit_hits(side, stop, tp, price_c):
+    """
+    Stop / take-profit hit masks, shared by the live and replay exit checks.
+    Signing by side (+1 long / -1 short) folds both directions into one compare;
+    `price_c` is a scalar or an array broadcast against the position columns.
+    """
+    hit_stop = side * (price_c - stop) <= 0
+    hit_tp = ~hit_stop & (side * (price_c - tp) >= 0)
+    return hit_stop, hit_tp
+
 class PaperTradingBot:
-    def __init__(self, starting_balance=10000.0, risk_pct=1.0):
-        self.balance = starting_balance
-        self.risk_pct = risk_pct
-        self.position_active = False
-        self.position_side = None
-        self.entry_price = 0.0
-        self.position_size = 0.0
-        self.stop_loss = 0.0
-        self.take_profit = 0.0
-
-    def calculate_position_size(self, stop_distance):
+    def __init__(self, starting_balance: float = 10000.0, risk_pct: float = 1.0,
+                 max_positions: int = MAX_POSITIONS):
+        self.balance_cents: int = round(starting_balance * PRICE_SCALE)
+        self.risk_pct: float = risk_pct
+        self.risk_ppm: int = round(risk_pct * RISK_SCALE / 100)
+        if risk_pct > 0 and self.risk_ppm == 0:
+            raise ValueError(f"risk_pct={risk_pct} is below the {100 / RISK_SCALE}% sizing resolution")
+        # Risk in ppm times paper leverage, fixed for the bot's lifetime
+        self._risk_mult: int = self.risk_ppm * PAPER_LEVERAGE_FACTOR
+        self.pos: np.ndarray = np.zeros(max_positions, dtype=POSITION_DTYPE)
+
+    @property
+    def balance(self) -> float:
+        return self.balance_cents / PRICE_SCALE
+
+    @property
+    def position_active(self) -> bool:
+        return bool(self.pos["live"].any())
+
+    @property
+    def position_side(self) -> Optional[str]:
+        """Side of the first open position, or None when flat."""
+        live = np.flatnonzero(self.pos["live"])
+        if len(live) == 0:
+            return None
+        return "long" if self.pos["side"][live[0]] == LONG else "short"
+
+    def calculate_position_size(self, stop_distance: float) -> float:
         """
         Add an extra leverage factor for more aggressive trades in paper mode.
         """
-        risk_amount = self.balance * (self.risk_pct / 100.0)
-        # Multiply by 10 => effectively 10x
-        risk_amount *= PAPER_LEVERAGE_FACTOR
-        if stop_distance <= 0:
+        return self._size_e4(round(stop_distance * PRICE_SCALE)) / SIZE_SCALE
+
+    def _size_e4(self, stop_cents: int) -> int:
+        if stop_cents <= 0:
             return 0
-        size = risk_amount / stop_distance
-        return round(size, 4)
+        risk_cents = self.balance_cents * self._risk_mult // RISK_SCALE
+        return risk_cents * SIZE_SCALE // stop_cents
 
-    def open_position(self, side, entry_price, stop_loss, take_profit):
-        if self.position_active:
-            log_message("[!] Already in a position, cannot open a new one.")
+    def open_position(self, side: str, entry_price: float, stop_loss: float, take_profit: float) -> None:
+        free = np.flatnonzero(~self.pos["live"])
+        if len(free) == 0:
+            log_message("[!] Already in a position, cannot open a new one.", level=logging.WARNING)
             return
 
-        self.position_active = True
-        self.position_side = side
-        self.entry_price = entry_price
-        self.stop_loss = stop_loss
-        self.take_profit = take_profit
-
-        stop_dist = abs(entry_price - stop_loss)
-        self.position_size = self.calculate_position_size(stop_dist)
+        entry_c = round(entry_price * PRICE_SCALE)
+        stop_c = round(stop_loss * PRICE_SCALE)
+        tp_c = round(take_profit * PRICE_SCALE)
+        size_e4 = self._size_e4(abs(entry_c - stop_c))
+        self.pos[free[0]] = (LONG if side == "long" else SHORT, entry_c, stop_c, tp_c, size_e4, True)
 
         log_message(f"TRADE OPEN {side.upper()} @ ${entry_price:.2f}, "
-                    f"Stop={stop_loss:.2f}, TP={take_profit:.2f}, Size={self.position_size}")
+                    f"Stop={stop_loss:.2f}, TP={take_profit:.2f}, Size={size_e4 / SIZE_SCALE}")
 
-    def check_exit(self, current_price):
-        if not self.position_active:
+    def check_exit(self, current_price: float) -> None:
+        pos = self.pos
+        live = pos["live"]
+        if not live.any():
             return
-        if self.position_side == "long":
-            if current_price <= self.stop_loss:
-                log_message(f"check_exit: LONG STOP triggered @ {current_price:.2f}.")
-                self.close_position(current_price, hit_stop=True)
-            elif current_price >= self.take_profit:
-                log_message(f"check_exit: LONG TAKE-PROFIT triggered @ {current_price:.2f}.")
-                self.close_position(current_price, hit_stop=False)
-        elif self.position_side == "short":
-            if current_price >= self.stop_loss:
-                log_message(f"check_exit: SHORT STOP triggered @ {current_price:.2f}.")
-                self.close_position(current_price, hit_stop=True)
-            elif current_price <= self.take_profit:
-                log_message(f"check_exit: SHORT TAKE-PROFIT triggered @ {current_price:.2f}.")
-                self.close_position(current_price, hit_stop=False)
-
-    def close_position(self, close_price, hit_stop=False):
-        if not self.position_active:
+        price_c = round(current_price * PRICE_SCALE)
+        side = pos["side"].astype(np.int64)
+        hit_stop, hit_tp = _exit_hits(side, pos["stop"], pos["tp"], price_c)
+        hit_stop &= live
+        hit_tp &= live
+        is_long = side == LONG
+
+        for i in np.flatnonzero(hit_stop | hit_tp):
+            label = "LONG" if is_long[i] else "SHORT"
+            kind = "STOP" if hit_stop[i] else "TAKE-PROFIT"
+            log_message(f"check_exit: {label} {kind} triggered @ {current_price:.2f}.")
+            self._close_slot(int(i), price_c, hit_stop=bool(hit_stop[i]))
+
+    def check_exit_vec(self, prices: np.ndarray) -> None:
+        """
+        Replay a price series (oldest first) against the open positions, closing
+        each at the first price that hits its stop or take-profit. For backtests:
+        one broadcast compare over prices x slots instead of a check_exit per bar.
+        """
+        live = np.flatnonzero(self.pos["live"])
+        if len(live) == 0 or len(prices) == 0:
             return
-        if self.position_side == "long":
-            profit = (close_price - self.entry_price) * self.position_size
-        else:
-            profit = (self.entry_price - close_price) * self.position_size
-
-        self.balance += profit
-        log_message(f"TRADE CLOSE {self.position_side.upper()} @ ${close_price:.2f} "
-                    f"{'STOP' if hit_stop else 'TP'} hit. PNL={profit:.2f}, "
+        pos = self.pos[live]
+        prices = np.asarray(prices, dtype=np.float64)
+        # NaN/inf bars (gaps in the series) would cast to INT64_MIN and look
+        # like a stop hit; convert them to 0 and mask them out of the hits.
+        valid = np.isfinite(prices)[:, None]
+        prices_c = np.rint(np.where(valid[:, 0], prices, 0.0) * PRICE_SCALE).astype(np.int64)[:, None]
+        hit_stop, hit_tp = _exit_hits(pos["side"].astype(np.int64), pos["stop"], pos["tp"], prices_c)
+        hit_stop &= valid
+        hit_tp &= valid
+        hit = hit_stop | hit_tp
+        first = hit.argmax(axis=0)
+        for j in np.flatnonzero(hit.any(axis=0)):
+            t = first[j]
+            self._close_slot(int(live[j]), int(prices_c[t, 0]), hit_stop=bool(hit_stop[t, j]))
+
+    def close_position(self, close_price: float, hit_stop: bool = False) -> None:
+        """Close every open position at `close_price`."""
+        close_c = round(close_price * PRICE_SCALE)
+        for i in np.flatnonzero(self.pos["live"]):
+            self._close_slot(int(i), close_c, hit_stop)
+
+    def _close_slot(self, i: int, close_c: int, hit_stop: bool) -> None:
+        p = self.pos[i]
+        side = int(p["side"])
+        profit_c = side * (close_c - int(p["entry"])) * int(p["size"]) // SIZE_SCALE
+        self.balance_cents += profit_c
+        log_message(f"TRADE CLOSE {'LONG' if side == LONG else 'SHORT'} @ ${close_c / PRICE_SCALE:.2f} "
+                    f"{'STOP' if hit_stop else 'TP'} hit. PNL={profit_c / PRICE_SCALE:.2f}, "
                     f"New Balance={self.balance:.2f}")
 
         # reset
-        self.position_active = False
-        self.position_side = None
-        self.entry_price = 0.0
-        self.position_size = 0.0
-        self.stop_loss = 0.0
-        self.take_profit = 0.0
+        self.pos[i] = 0
 
 # ------------------------------------------------------------------------------------
 # STRATEGY
 # ------------------------------------------------------------------------------------
-def strategy_decision(df_med, df_short, bot: PaperTradingBot):
-    """Check 5m SMA trend, then 1m RSI ~ 50 => buy/sell."""
-    if df_med.empty or df_short.empty:
-        return "NONE"
-
-    last_med = df_med.iloc[-1]
-    sma_value = last_med["SMA"]
-    if pd.isna(sma_value):
+def strategy_decision(sma_med, close_med, rsi_short, close_short, bot: PaperTradingBot):
+    """Check 5m SMA trend, then 1m RSI ~ 50 => buy/sell. Inputs are the latest values."""
+    # NaN is the only value not equal to itself; avoids two global+attr lookups
+    if sma_med != sma_med or rsi_short != rsi_short:
         return "NONE"
-    current_price_med = last_med["Close"]
 
     # If price above 5m SMA => uptrend; else downtrend
-    medium_trend = "UP" if current_price_med > sma_value else "DOWN"
-
-    last_short = df_short.iloc[-1]
-    rsi_value = last_short["RSI"]
-    if pd.isna(rsi_value):
-        return "NONE"
-    current_price_short = last_short["Close"]
+    medium_trend = "UP" if close_med > sma_med else "DOWN"
 
     if bot.position_active:
         return "NONE"
 
     # If uptrend + RSI<50 => buy, if downtrend + RSI>50 => sell
-    if medium_trend == "UP" and rsi_value < RSI_OVERSOLD:
-        log_message(f"Signal: BUY (Uptrend + RSI={rsi_value:.2f} < 50)")
+    if medium_trend == "UP" and rsi_short < RSI_OVERSOLD:
+        log_message(f"Signal: BUY (Uptrend + RSI={rsi_short:.2f} < 50)")
         return "BUY"
-    elif medium_trend == "DOWN" and rsi_value > RSI_OVERBOUGHT:
-        log_message(f"Signal: SELL (Downtrend + RSI={rsi_value:.2f} > 50)")
+    elif medium_trend == "DOWN" and rsi_short > RSI_OVERBOUGHT:
+        log_message(f"Signal: SELL (Downtrend + RSI={rsi_short:.2f} > 50)")
         return "SELL"
 
-    log_message(f"Signal: NONE (Trend={medium_trend}, RSI={rsi_value:.2f})")
+    log_message(f"Signal: NONE (Trend={medium_trend}, RSI={rsi_short:.2f})")
     return "NONE"
 
 # ------------------------------------------------------------------------------------
@@ -611,6 +1464,19 @@ def strategy_decision(df_med, df_short, bot: PaperTradingBot):
 # ------------------------------------------------------------------------------------
 def main_loop():
     bot = PaperTradingBot(STARTING_BALANCE, RISK_PER_TRADE_PCT)
+    warmup_kernels()
+    store = CandleStore(CANDLE_DB_PATH) if CANDLE_DB_PATH else None
+    med_cache = CandleCache(BINANCE_SYMBOL, MEDIUM_TIMEFRAME, limit=MEDIUM_CANDLE_LIMIT,
+                            sma_period=SMA_PERIOD, rsi_period=RSI_PERIOD, store=store)
+    short_cache = CandleCache(BINANCE_SYMBOL, SHORT_TIMEFRAME, limit=SHORT_CANDLE_LIMIT,
+                              sma_period=SMA_PERIOD, rsi_period=RSI_PERIOD, store=store)
+    stream = None
+    if USE_WEBSOCKET:
+        if websockets is None:
+            log_message("websockets not installed, polling klines over REST.")
+        else:
+            stream = KlineStream([med_cache, short_cache])
+            stream.start()
     try:
         if GMX_VERSION == "v2":
             gmx = GMXV2Connector(web3, acct, do_live=LIVE_TRADING)
@@ -629,72 +1495,97 @@ def main_loop():
         "rsi": 0.0,
         "last_action": "NONE"
     })
+    publish_status()
 
     # If real trades, do one-time approvals (collateral, plugin)
     if LIVE_TRADING and gmx and gmx.do_live:
         if GMX_VERSION == "v2":
-            gmx.approve_collateral(1000 * 10**6)
+            gmx.approve_collateral(1000 * USDT_DECIMALS)
         else:
             gmx.approve_plugin()
-            gmx.approve_usdt(1000 * 10**6)  # e.g. 1000 USDT allowance
+            gmx.approve_usdt(1000 * USDT_DECIMALS)  # e.g. 1000 USDT allowance
+        gmx.prime()
 
     while True:
-        log_message("=== NEW CYCLE: Fetching Candle Data ===")
-        df_med = fetch_binance_candles(BINANCE_SYMBOL, MEDIUM_TIMEFRAME, limit=MEDIUM_CANDLE_LIMIT)
-        df_short = fetch_binance_candles(BINANCE_SYMBOL, SHORT_TIMEFRAME, limit=SHORT_CANDLE_LIMIT)
-
-        if df_med.empty or df_short.empty:
-            log_message("[!] Could not fetch data properly, skipping cycle.")
+        cycle_start_ns = time.monotonic_ns()
+        # Clear before reading the caches: a close pushed from here on stays set
+        # and cuts the wait at the end of this cycle short.
+        NEW_CANDLE.clear()
+        if stream is not None and stream.connected:
+            log_message("=== NEW CYCLE: Reading Streamed Candles ===")
+            med, short = med_cache.candles, short_cache.candles
+        else:
+            log_message("=== NEW CYCLE: Fetching Candle Data ===")
+            med = med_cache.candles
+            if med is None or time.time() * 1000 >= med.ts[-1] + med_cache.interval_ms:
+                # No window yet, or a new medium candle has opened by the clock:
+                # both timeframes need REST, so fetch them concurrently.
+                fut_med = EXECUTOR.submit(med_cache.refresh)
+                fut_short = EXECUTOR.submit(short_cache.refresh)
+                med, short = fut_med.result(), fut_short.result()
+            else:
+                short = short_cache.refresh()
+                if short is not None and short.ts[-1] < med.ts[-1] + med_cache.interval_ms:
+                    # Still inside the same medium candle: its close is the latest
+                    # price, which the short fetch just returned. No REST call needed.
+                    med = med_cache.apply_kline({"t": int(med.ts[-1]), "c": short.close[-1]})
+                else:
+                    # Local clock lags Binance: the rollover showed up in the short data.
+                    med = med_cache.refresh()
+
+        if med is None or short is None:
+            log_message("[!] Could not fetch data properly, skipping cycle.", level=logging.WARNING)
+            publish_status()
             time.sleep(LOOP_INTERVAL)
             continue
 
-        df_med = compute_indicators(df_med, sma_period=SMA_PERIOD, rsi_period=RSI_PERIOD)
-        df_short = compute_indicators(df_short, sma_period=SMA_PERIOD, rsi_period=RSI_PERIOD)
-
+        current_price = float(short.close[-1])
+        sma_med = float(med.sma[-1])
+        rsi_short = float(short.rsi[-1])
         if bot.position_active:
-            current_price = df_short.iloc[-1]["Close"]
             bot.check_exit(current_price)
 
-        signal = strategy_decision(df_med, df_short, bot)
+        signal = strategy_decision(sma_med, float(med.close[-1]), rsi_short, current_price, bot)
         if signal == "BUY":
-            current_price = df_short.iloc[-1]["Close"]
-            stop_loss = current_price * 0.995    # 0.5% stop
-            take_profit = current_price * 1.005  # 0.5% take profit
+            stop_loss = current_price * SL_MULT_LONG
+            take_profit = current_price * TP_MULT_LONG
             bot.open_position("long", current_price, stop_loss, take_profit)
 
             # Real GMX
             if LIVE_TRADING and gmx and gmx.do_live:
-                collateral = 200 * 10**6  # e.g. 200 USDT
+                collateral = 200 * USDT_DECIMALS  # e.g. 200 USDT
                 size_usd = 1000  # => 5x if we deposit 200 USDT
-                gmx.open_gmx_position("long", collateral, size_usd)
+                gmx.open_gmx_position("long", collateral, size_usd, current_price)
 
         elif signal == "SELL":
-            current_price = df_short.iloc[-1]["Close"]
-            stop_loss = current_price * 1.005
-            take_profit = current_price * 0.995
+            stop_loss = current_price * SL_MULT_SHORT
+            take_profit = current_price * TP_MULT_SHORT
             bot.open_position("short", current_price, stop_loss, take_profit)
 
             if LIVE_TRADING and gmx and gmx.do_live:
-                collateral = 200 * 10**6
+                collateral = 200 * USDT_DECIMALS
                 size_usd = 1000
-                gmx.open_gmx_position("short", collateral, size_usd)
+                gmx.open_gmx_position("short", collateral, size_usd, current_price)
 
         # Update status for the UI
-        current_price = df_short.iloc[-1]["Close"]
         status_data.update({
             "balance": round(bot.balance, 2),
             "position": bot.position_side or "NONE",
             "eth_price": round(current_price, 2),
-            "sma": round(df_med.iloc[-1]["SMA"], 2),
-            "rsi": round(df_short.iloc[-1]["RSI"], 2),
+            "sma": round(sma_med, 2),
+            "rsi": round(rsi_short, 2),
             "last_action": signal if signal != "NONE" else status_data["last_action"]
         })
 
-        log_message(f"Cycle complete. Current price={current_price:.2f}, "
-                    f"Balance={bot.balance:.2f}")
-        time.sleep(LOOP_INTERVAL)
+        log_message("Cycle complete in %.1f ms. Current price=%.2f, Balance=%.2f",
+                    (time.monotonic_ns() - cycle_start_ns) / 1e6, current_price, bot.balance)
+        publish_status()
+        NEW_CANDLE.wait(timeout=LOOP_INTERVAL)
 
 if __name__ == "__main__":
     bot_thread = Thread(target=main_loop, daemon=True)
     bot_thread.start()
-    app.run(host="0.0.0.0", port=8080)
+    if serve is not None:
+        serve(app, host="0.0.0.0", port=8080, threads=4)
+    else:
+        app.run(host="0.0.0.0", port=8080)